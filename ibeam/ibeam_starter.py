@@ -99,6 +99,9 @@ if __name__ == '__main__':
         machine_name=cnf.MACHINE_NAME,
         paper_account=cnf.PAPER_IBEAM_ACCOUNT,
         paper_password=cnf.PAPER_IBEAM_PASSWORD,
+        db_check_ttl=cnf.DB_CHECK_TTL,
+        db_check_timeout=cnf.DB_CHECK_TIMEOUT,
+        request_timeout=cnf.REQUEST_TIMEOUT,
     )
 
     targets = create_targets(cnf)
@@ -1,9 +1,40 @@
 import logging
-import os
-from pathlib import Path
+import threading
+import time
+from decimal import Decimal
 from typing import Optional
 
-_LOGGER = logging.getLogger('ibeam.' + Path(__file__).stem)
+_LOGGER = logging.getLogger('ibeam.db_handler')
+
+_PAPER_SQL = "SELECT `use_paper_account` FROM `IBEAM` WHERE `machine_name` = %s LIMIT 1"
+"""Query for the paper account setting of a machine."""
+
+_DB_TIMEOUT = 3
+"""Seconds to wait when connecting to, reading from or writing to the database."""
+
+_TRUTHY = frozenset({'true', '1', 'yes', 'on', 'y', 't'})
+"""String values of use_paper_account that are treated as True."""
+
+
+def _str_to_bool(value: str) -> bool:
+    return value.strip().lower() in _TRUTHY
+
+
+def _bytes_to_bool(value: bytes) -> bool:
+    # BIT(1) columns are returned as b'\x00' or b'\x01'
+    if len(value) == 1 and value[0] in (0, 1):
+        return bool(value[0])
+    return _str_to_bool(value.decode())
+
+
+_COERCERS = {
+    bool: bool,
+    int: bool,
+    Decimal: bool,
+    str: _str_to_bool,
+    bytes: _bytes_to_bool,
+}
+"""Functions converting use_paper_account values to bool, keyed by the type returned from the database."""
 
 
 class DatabaseHandler:
@@ -11,47 +42,97 @@ class DatabaseHandler:
 
     def __init__(self, db_host: Optional[str], db_user: Optional[str],
                  db_password: Optional[str], db_name: Optional[str],
-                 machine_name: Optional[str]):
+                 machine_name: Optional[str],
+                 ttl_seconds: int = 300):
         self.db_host = db_host
         self.db_user = db_user
         self.db_password = db_password
         self.db_name = db_name
         self.machine_name = machine_name
-        self._connection = None
+        self.ttl_seconds = ttl_seconds
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._cached_value = None
+        self._cached_at = None
+
+    def _get_pool(self):
+        """Create the connection pool on first use and return it."""
+        if self._pool is not None:
+            return self._pool
+
+        with self._pool_lock:
+            if self._pool is None:
+                import pymysql
+                from dbutils.pooled_db import PooledDB
+
+                # ibeam issues at most one query at a time, keep the pool small
+                self._pool = PooledDB(
+                    creator=pymysql,
+                    mincached=1,
+                    maxcached=2,
+                    maxconnections=4,
+                    host=self.db_host,
+                    user=self.db_user,
+                    password=self.db_password,
+                    database=self.db_name,
+                    # bound how long a misconfigured or unreachable database can block the login
+                    connect_timeout=_DB_TIMEOUT,
+                    read_timeout=_DB_TIMEOUT,
+                    write_timeout=_DB_TIMEOUT,
+                )
+                _LOGGER.info('Successfully connected to database at %s', self.db_host)
+        return self._pool
 
     def _connect(self):
-        """Establish connection to the database."""
+        """Check out a connection from the database connection pool."""
         if not all([self.db_host, self.db_user, self.db_password, self.db_name]):
             _LOGGER.debug('Database credentials not fully configured, skipping database check.')
             return None
 
         try:
             import pymysql
-            self._connection = pymysql.connect(
-                host=self.db_host,
-                user=self.db_user,
-                password=self.db_password,
-                database=self.db_name,
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            _LOGGER.info(f'Successfully connected to database at {self.db_host}')
-            return self._connection
+            from pymysql.constants import CR, ER
+            return self._get_pool().connection()
         except ImportError:
-            _LOGGER.warning('pymysql not installed. Install with: pip install pymysql')
+            _LOGGER.warning('pymysql or DBUtils not installed. Install with: pip install pymysql DBUtils')
+            return None
+        except pymysql.err.OperationalError as e:
+            code = e.args[0] if e.args else None
+            if code in (ER.ACCESS_DENIED_ERROR, ER.DBACCESS_DENIED_ERROR):
+                _LOGGER.error('Database at %s rejected the credentials of user %s: %s', self.db_host, self.db_user, e)
+            elif code in (CR.CR_CONN_HOST_ERROR, CR.CR_SERVER_GONE_ERROR, CR.CR_SERVER_LOST):
+                _LOGGER.error('Database at %s is unreachable: %s', self.db_host, e)
+            else:
+                _LOGGER.error('Failed to connect to database: %s', e)
             return None
         except Exception as e:
-            _LOGGER.error(f'Failed to connect to database: {e}')
+            _LOGGER.error('Failed to connect to database: %s', e)
             return None
 
     def should_use_paper_account(self) -> Optional[bool]:
         """
         Query the database to check if this machine should use paper account.
 
+        The result is cached for ttl_seconds, after which the database is queried again.
+
         Returns:
             True if paper account should be used
             False if live account should be used
             None if database check is not configured or failed
         """
+        if self.is_cached():
+            return self._cached_value
+
+        self._cached_value = self._query_use_paper_account()
+        self._cached_at = time.monotonic()
+        return self._cached_value
+
+    def is_cached(self) -> bool:
+        """Whether should_use_paper_account can be answered from the cache, without querying the database."""
+        return self._cached_at is not None and time.monotonic() - self._cached_at < self.ttl_seconds
+
+    def _query_use_paper_account(self) -> Optional[bool]:
+        """Query the database for this machine's paper account setting, bypassing the cache."""
         if not self.machine_name:
             _LOGGER.debug('Machine name not configured, skipping database check.')
             return None
@@ -63,36 +144,30 @@ class DatabaseHandler:
         try:
             with connection.cursor() as cursor:
                 # Query the IBEAM table for the machine name
-                sql = "SELECT * FROM ibeam WHERE machine_name = %s"
-                cursor.execute(sql, (self.machine_name,))
+                cursor.execute(_PAPER_SQL, (self.machine_name,))
                 result = cursor.fetchone()
 
                 if result:
                     # Check if the value is true (could be stored as boolean, int, or string)
-                    use_paper = result.get('use_paper_account')
-
-                    # Handle different types: boolean, int (1/0), or string ('true'/'false')
-                    if isinstance(use_paper, bool):
-                        _LOGGER.info(f'Database check: machine {self.machine_name} should {"" if use_paper else "NOT "}use paper account')
-                        return use_paper
-                    elif isinstance(use_paper, int):
-                        use_paper_bool = bool(use_paper)
-                        _LOGGER.info(f'Database check: machine {self.machine_name} should {"" if use_paper_bool else "NOT "}use paper account')
-                        return use_paper_bool
-                    elif isinstance(use_paper, str):
-                        use_paper_bool = use_paper.lower() in ('true', '1', 'yes')
-                        _LOGGER.info(f'Database check: machine {self.machine_name} should {"" if use_paper_bool else "NOT "}use paper account')
-                        return use_paper_bool
-                    else:
-                        print(result)
-                        _LOGGER.warning(f'Unknown value type for use_paper_account: {type(use_paper)}')
+                    use_paper = result[0]
+
+                    # Handle different types: boolean, int/decimal (1/0), bit, or string ('true'/'false')
+                    coerce = _COERCERS.get(type(use_paper))
+                    if coerce is None:
+                        _LOGGER.warning('Unknown value type for use_paper_account: %s (%r)', type(use_paper), use_paper)
                         return None
+
+                    use_paper_bool = coerce(use_paper)
+                    should = 'should' if use_paper_bool else 'should NOT'
+                    _LOGGER.info('Database check: machine %s %s use paper account', self.machine_name, should)
+                    return use_paper_bool
                 else:
-                    _LOGGER.info(f'No database entry found for machine {self.machine_name}, using default configuration')
+                    _LOGGER.info('No database entry found for machine %s, using default configuration', self.machine_name)
                     return None
 
         except Exception as e:
-            _LOGGER.error(f'Error querying database: {e}')
+            _LOGGER.error('Error querying database: %s', e)
             return None
         finally:
+            # returns the connection to the pool rather than closing it
             connection.close()
@@ -154,6 +154,7 @@ class LoginHandler():
                    password: str,
                    key: str,
                    presubmit_buffer: int,
+                   use_paper: bool = False,
                    ):
 
         if account is None:
@@ -170,7 +171,7 @@ class LoginHandler():
         user_name_el = find_element(targets['USER_NAME'], driver)
         password_el = find_element(targets['PASSWORD'], driver)
 
-        if self.secrets_handler.use_paper_account:
+        if use_paper:
             _LOGGER.info('Switching to paper mode')
             live_paper_toggle_el = find_element(targets['LIVE_PAPER_TOGGLE'], driver)
             live_paper_toggle_el.click()
@@ -352,6 +353,10 @@ class LoginHandler():
             else:
                 _LOGGER.warning(f'Increased presubmit buffer to {self.presubmit_buffer}')
 
+        if error_trigger.text == 'Invalid username password combination':
+            # credentials may have been rotated since they were cached, read them again on next attempt
+            self.secrets_handler.refresh()
+
         # try to prevent having the account locked-out
         if error_trigger.text == 'failed' or error_trigger.text == 'Invalid username password combination' and max_failed_auth > 0:
             self.failed_attempts += 1
@@ -414,7 +419,9 @@ class LoginHandler():
             wait_and_identify_trigger: callable,
             driver: webdriver.Chrome
     ):
-        trigger, target = self.step_login(targets, wait_and_identify_trigger, driver, self.secrets_handler.account, self.secrets_handler.password, self.secrets_handler.key, self.presubmit_buffer)
+        # decide paper vs live once per attempt, so the toggle always matches the credentials
+        use_paper, account, password = self.secrets_handler.credentials
+        trigger, target = self.step_login(targets, wait_and_identify_trigger, driver, account, password, self.secrets_handler.key, self.presubmit_buffer, use_paper)
 
         if target == targets['ERROR'] and trigger.text == 'You have selected the Live Account Mode, but the specified user is a Paper Trading user. Please select the correct Login mode.':
             trigger, target = self.step_paper_toggle(driver, targets, wait_and_identify_trigger)
@@ -475,6 +482,9 @@ class LoginHandler():
         targets = self.targets
 
         try:
+            # read the secrets needed for the paper/live decision while the browser starts up
+            self.secrets_handler.prefetch()
+
             _LOGGER.info(f'Loading auth webpage at {self.base_url + self.route_auth}')
             driver, display = start_up_browser(self.driver_factory)
             if driver is None:
@@ -1,13 +1,19 @@
 import base64
+import binascii
+import concurrent.futures
 import logging
 import os
+import threading
+import time
 from pathlib import Path
 from typing import Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from ibeam.src.handlers.db_handler import DatabaseHandler
 
-_LOGGER = logging.getLogger('ibeam.' + Path(__file__).stem)
+_LOGGER = logging.getLogger('ibeam.secrets_handler')
 
 SECRETS_SOURCE_ENV = 'env'
 SECRETS_SOURCE_FS = 'fs'
@@ -33,6 +39,42 @@ In this case IBEAM_GCP_BASE_URL must also be provided in form of:
 https://secretmanager.googleapis.com/v1/projects/[PROJECT_ID]/secrets
 """
 
+_DEFAULT_RSTRIP = '\r\n'
+
+_PREFETCHED_SECRETS = ('IBEAM_ACCOUNT', 'IBEAM_PASSWORD', 'IBEAM_KEY')
+"""Secrets read in parallel by SecretsHandler.prefetch."""
+
+_LIVE_CREDENTIAL_SECRETS = ('IBEAM_ACCOUNT', 'IBEAM_PASSWORD')
+"""Secrets replaced by the paper account credentials when the database selects the paper account."""
+
+_GCP_METADATA_TOKEN_URL = 'http://169.254.169.254/computeMetadata/v1/instance/service-accounts/default/token'
+
+_GCP_TOKEN_EXPIRY_MARGIN = 60
+"""How many seconds before its expiry a cached GCP access token is requested again."""
+
+
+def _strip(value: str, lstrip: Optional[str], rstrip: Optional[str]) -> str:
+    """Strip lstrip characters from the left and rstrip characters from the right of value, in a single pass where possible."""
+    if lstrip is None:
+        return value if rstrip is None else value.rstrip(rstrip)
+    if rstrip is None:
+        return value.lstrip(lstrip)
+    if lstrip == rstrip:
+        return value.strip(lstrip)
+    return value.lstrip(lstrip).rstrip(rstrip)
+
+
+def _file_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _no_mtime(value: str) -> None:
+    return None
+
+
 class SecretsHandler():
     ...
     def __init__(self,
@@ -45,29 +87,72 @@ class SecretsHandler():
                  machine_name: Optional[str] = None,
                  paper_account: Optional[str] = None,
                  paper_password: Optional[str] = None,
+                 db_check_ttl: int = 300,
+                 db_check_timeout: int = 10,
+                 request_timeout: int = 15,
                  ):
         self.secrets_source = secrets_source
         self.gcp_base_url = gcp_base_url
+        self.request_timeout = request_timeout
+
+        # resolve the reader for the secrets source once rather than on every read
+        self._reader = {
+            SECRETS_SOURCE_ENV: self._read_env,
+            SECRETS_SOURCE_FS: self._read_fs,
+            SECRETS_SOURCE_GCP_SECRETS: self._read_gcp,
+        }.get(self.secrets_source, self._read_unknown)
+        # only FS secrets are re-read when their file changes
+        self._mtime = _file_mtime if self.secrets_source == SECRETS_SOURCE_FS else _no_mtime
+
+        # reuse connections to the GCP metadata server and Secret Manager across secret reads
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4,
+                              max_retries=Retry(total=2, backoff_factor=0.2))
+        self._http.mount('http://', adapter)
+        self._http.mount('https://', adapter)
+        self._gcp_token = None
+        self._gcp_token_expiry = 0
+        self._gcp_token_lock = threading.Lock()
 
         """Character encoding for secret files"""
         self.encoding = os.environ.get(
             'IBEAM_ENCODING', default='UTF-8')
 
-        # Database configuration
-        self.db_handler = DatabaseHandler(
-            db_host=db_host,
-            db_user=db_user,
-            db_password=db_password,
-            db_name=db_name,
-            machine_name=machine_name
-        )
+        # Database configuration, only used when fully configured
+        if all([db_host, db_user, db_password, db_name, machine_name]):
+            self.db_handler = DatabaseHandler(
+                db_host=db_host,
+                db_user=db_user,
+                db_password=db_password,
+                db_name=db_name,
+                machine_name=machine_name,
+                ttl_seconds=db_check_ttl,
+            )
+        else:
+            _LOGGER.debug('Database not fully configured, skipping database checks.')
+            self.db_handler = None
+        self.db_check_timeout = db_check_timeout
         self.paper_account = paper_account
         self.paper_password = paper_password
         self._use_paper_from_db = None
-        self._db_check_done = False
+
+        # start the first database check in the background so it overlaps with the rest of the startup
+        self._db_future = None
+        self._db_timed_out = False
+        if self.db_handler is not None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self._db_future = executor.submit(self.db_handler.should_use_paper_account)
+            executor.shutdown(wait=False)
+
+        # successfully read secrets, keyed by secret_value arguments
+        self._secret_cache = {}
+        # (path, modification time) of FS secrets at the time they were cached
+        self._file_mtimes = {}
+        # pending secret reads started by prefetch, keyed by secret name
+        self._futures = {}
 
     def secret_value(self, encoding, name: str,
-                     lstrip=None, rstrip='\r\n') -> Optional[str]:
+                     lstrip=None, rstrip=_DEFAULT_RSTRIP) -> Optional[str]:
         """
         secret_value reads secrets from os.environ or from
         the filesystem.
@@ -90,6 +175,11 @@ class SecretsHandler():
         as text and its contents returned as the secret
         value.
 
+        Successfully read values are cached, so subsequent
+        calls do not read the environment, filesystem or GCP
+        again until refresh() is called. Values read from
+        files are read again once the file is modified.
+
         Parameters:
           name:
             The identifier for the value, e.g.,
@@ -117,80 +207,156 @@ class SecretsHandler():
           If an error is encountered reading the file then
           an error is logged and None is returned.
         """
+        cache_key = (encoding, name, lstrip, rstrip)
+        if cache_key in self._secret_cache and not self._file_changed(cache_key):
+            return self._secret_cache[cache_key]
+
         # read the environment value for name
         value = os.environ.get(name)
         if value is None:
             # no key for this name, nothing to do
             return None
 
+        # stat before reading so that a modification during the read is not missed
+        mtime = self._mtime(value)
+
+        secret = self._reader(encoding, name, value, lstrip, rstrip)
+        if secret is not None:
+            self._secret_cache[cache_key] = secret
+            if mtime is not None:
+                self._file_mtimes[cache_key] = (value, mtime)
+        return secret
+
+    def refresh(self):
+        """Discard cached secret values so that they are read again on next access."""
+        self._futures.clear()
+        self._secret_cache.clear()
+        self._file_mtimes.clear()
+
+    def prefetch(self):
+        """
+        Start reading the account, password and key secrets in parallel, so that
+        they are ready by the time the corresponding properties are accessed.
+
+        Secrets held directly in the environment need no I/O and are not prefetched.
+        The live account and password are skipped when the paper account is already
+        known to be used. This never waits for the database.
+        """
         if self.secrets_source == SECRETS_SOURCE_ENV:
-            # treat environment values as the secrets themselves
-            if lstrip is not None:
-                value = value.lstrip(lstrip)
-
-            if rstrip is not None:
-                value = value.rstrip(rstrip)
-
-            return value
-        elif self.secrets_source == SECRETS_SOURCE_FS:
-            # treat environment values as filesystem paths to the secrets
-            if not os.path.isfile(value):
-                _LOGGER.error(
-                    f'Unable to read env value for {name}: value is not a file')
-                return None
-
-            try:
-                with open(value, mode='rt', encoding=encoding) as fh:
-                    secret = fh.read()
-
-                    if lstrip is not None:
-                        secret = secret.lstrip(lstrip)
-
-                    if rstrip is not None:
-                        secret = secret.rstrip(rstrip)
-
-                    return secret
-            except IOError:
-                _LOGGER.error(
-                    f'Unable to read env value for {name} as a file.')
-                return None
-        elif self.secrets_source == SECRETS_SOURCE_GCP_SECRETS:
-            # get authentication token from GCP
-            response = requests.get('http://169.254.169.254/computeMetadata/v1/instance/service-accounts/default/token', headers={'Metadata-Flavor': 'Google'})
-            if response.status_code != 200:
-                _LOGGER.error(f'Google Metadata request returned status code {response.status_code} :: {response.reason} :: {response.text}')
-                return None
-
-            access_token = response.json()['access_token']
-
-            # get secret from GCP
-            secret_url = self.gcp_base_url + '/' + value + ':access'
-            response2 = requests.get(secret_url, headers={'authorization': f'Bearer {access_token}'})
-            if response2.status_code!= 200:
-                _LOGGER.error(f'Google Secret Manager request returned status code {response2.status_code} :: {response2.reason} :: {response2.text}')
-                return None
+            return
+
+        names = _PREFETCHED_SECRETS
+        if self._paper_decision_known() and self._should_use_paper_account():
+            names = tuple(name for name in names if name not in _LIVE_CREDENTIAL_SECRETS)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(names))
+        self._futures = {name: executor.submit(self.secret_value, self.encoding, name) for name in names}
+        executor.shutdown(wait=False)
+
+    def _secret(self, name: str) -> Optional[str]:
+        """Return the secret for name, using the read started by prefetch if there is one."""
+        future = self._futures.pop(name, None)
+        if future is not None:
+            return future.result()
+        return self.secret_value(self.encoding, name)
+
+    def _file_changed(self, cache_key) -> bool:
+        """Whether the file a cached secret was read from has been modified since."""
+        if cache_key not in self._file_mtimes:
+            return False
+        path, mtime = self._file_mtimes[cache_key]
+        return _file_mtime(path) != mtime
+
+    def _read_env(self, encoding, name: str, value: str, lstrip, rstrip) -> Optional[str]:
+        """Treat the environment value as the secret itself."""
+        return _strip(value, lstrip, rstrip)
+
+    def _read_fs(self, encoding, name: str, value: str, lstrip, rstrip) -> Optional[str]:
+        """Treat the environment value as a filesystem path to the secret."""
+        try:
+            secret = Path(value).read_text(encoding=encoding)
+        except OSError as e:
+            _LOGGER.error(
+                'Unable to read env value for %s as a file: %s', name, e)
+            return None
+
+        return _strip(secret, lstrip, rstrip)
+
+    def _read_gcp(self, encoding, name: str, value: str, lstrip, rstrip) -> Optional[str]:
+        """Treat the environment value as a GCP Secret Manager secret name and version."""
+        access_token = self._get_gcp_token()
+        if access_token is None:
+            return None
+
+        # get secret from GCP
+        secret_url = self.gcp_base_url + '/' + value + ':access'
+        response2 = self._http.get(secret_url, headers={'authorization': f'Bearer {access_token}'}, timeout=self.request_timeout)
+        if response2.status_code!= 200:
+            _LOGGER.error('Google Secret Manager request returned status code %s :: %s :: %s', response2.status_code, response2.reason, response2.text)
+            return None
 
+        try:
             payload_data = response2.json()['payload']['data']
-            try:
-                base64_data =  base64.b64decode(payload_data)
-                decoded_data = base64_data.decode('utf-8')
-            except Exception as e:
-                _LOGGER.error(f'Unable to decode secret value for {name}: {e}')
-                return None
-            return decoded_data
+            decoded_data = base64.b64decode(payload_data, validate=True).decode('utf-8')
+        except (KeyError, ValueError, binascii.Error, UnicodeDecodeError) as e:
+            _LOGGER.error('Unable to decode secret value for %s: %s', name, e)
+            return None
+        return decoded_data
 
-        else:
-            _LOGGER.error(
-                f'Unknown Secrets Source: {self.secrets_source}')
+    def _get_gcp_token(self) -> Optional[str]:
+        """Get an authentication token from the GCP metadata server, reusing the previous one until it is about to expire."""
+        with self._gcp_token_lock:
+            return self._get_gcp_token_locked()
+
+    def _get_gcp_token_locked(self) -> Optional[str]:
+        if self._gcp_token is not None and time.monotonic() < self._gcp_token_expiry - _GCP_TOKEN_EXPIRY_MARGIN:
+            return self._gcp_token
+
+        response = self._http.get(_GCP_METADATA_TOKEN_URL, headers={'Metadata-Flavor': 'Google'}, timeout=2)
+        if response.status_code != 200:
+            _LOGGER.error('Google Metadata request returned status code %s :: %s :: %s', response.status_code, response.reason, response.text)
             return None
 
+        token = response.json()
+        self._gcp_token = token['access_token']
+        self._gcp_token_expiry = time.monotonic() + token['expires_in']
+        return self._gcp_token
+
+    def _read_unknown(self, encoding, name: str, value: str, lstrip, rstrip) -> Optional[str]:
+        _LOGGER.error(
+            'Unknown Secrets Source: %s', self.secrets_source)
+        return None
 
     def _check_database(self):
-        """Check database once to determine if paper account should be used."""
-        if not self._db_check_done:
-            self._use_paper_from_db = self.db_handler.should_use_paper_account()
-            self._db_check_done = True
-            _LOGGER.debug(f'Database check result: {self._use_paper_from_db}')
+        """Check database to determine if paper account should be used. Results are cached by the DatabaseHandler."""
+        if self.db_handler is None:
+            self._use_paper_from_db = False
+            return
+
+        if self._db_future is not None:
+            # wait for the check started in __init__ rather than querying in parallel with it,
+            # only waiting the full timeout once
+            timeout = 0 if self._db_timed_out else self.db_check_timeout
+            done, _ = concurrent.futures.wait([self._db_future], timeout=timeout)
+            if not done:
+                if not self._db_timed_out:
+                    _LOGGER.error('Database check did not complete within %s seconds, using default configuration until it does', self.db_check_timeout)
+                    self._db_timed_out = True
+                self._use_paper_from_db = None
+                return
+            self._db_future = None
+
+        # served from the DatabaseHandler cache if the background check is still fresh
+        self._use_paper_from_db = self.db_handler.should_use_paper_account()
+        _LOGGER.debug('Database check result: %s', self._use_paper_from_db)
+
+    def _paper_decision_known(self) -> bool:
+        """Whether _should_use_paper_account can be answered without waiting for or querying the database."""
+        if self.db_handler is None:
+            return True
+        if self._db_future is not None and not self._db_future.done():
+            return False
+        return self.db_handler.is_cached()
 
     def _should_use_paper_account(self) -> bool:
         """Determine if paper account should be used based on database or environment."""
@@ -208,7 +374,7 @@ class SecretsHandler():
             return self.paper_account
 
         # Otherwise use regular account
-        return self.secret_value(self.encoding, 'IBEAM_ACCOUNT')
+        return self._secret('IBEAM_ACCOUNT')
 
     @property
     def password(self):
@@ -219,7 +385,21 @@ class SecretsHandler():
             return self.paper_password
 
         # Otherwise use regular password
-        return self.secret_value(self.encoding, 'IBEAM_PASSWORD')
+        return self._secret('IBEAM_PASSWORD')
+
+    @property
+    def credentials(self) -> (bool, Optional[str], Optional[str]):
+        """
+        Whether to use paper account mode, along with the IBKR account name and password
+        to log in with, all resolved from a single database check.
+        """
+        # If database says use paper account and paper credentials are available
+        if self._should_use_paper_account():
+            _LOGGER.info('Using paper account credentials from database configuration')
+            return True, self.paper_account, self.paper_password
+
+        # Otherwise use regular account
+        return False, self._secret('IBEAM_ACCOUNT'), self._secret('IBEAM_PASSWORD')
 
     @property
     def use_paper_account(self) -> bool:
@@ -229,4 +409,4 @@ class SecretsHandler():
     @property
     def key(self):
         """Key to the IBKR password."""
-        return self.secret_value(self.encoding, 'IBEAM_KEY')
\ No newline at end of file
+        return self._secret('IBEAM_KEY')
\ No newline at end of file
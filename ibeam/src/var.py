@@ -204,6 +204,12 @@ DBNAME = os.environ.get('DBNAME', None)
 MACHINE_NAME = os.environ.get('MACHINE_NAME', None)
 """Machine name to query in database."""
 
+DB_CHECK_TTL = int(os.environ.get('IBEAM_DB_CHECK_TTL', 300))
+"""How many seconds the database paper account check result is cached for."""
+
+DB_CHECK_TIMEOUT = int(os.environ.get('IBEAM_DB_CHECK_TIMEOUT', 10))
+"""How many seconds to wait for the initial database paper account check before using the default configuration."""
+
 ########### PAPER ACCOUNT CREDENTIALS ###########
 
 PAPER_IBEAM_ACCOUNT = os.environ.get('PAPER_IBEAM_ACCOUNT', None)
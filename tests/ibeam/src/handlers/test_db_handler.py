@@ -0,0 +1,94 @@
+"""
+Tests for ibeam.src.handlers.db_handler
+"""
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+
+from ibeam.src.handlers.db_handler import DatabaseHandler, _COERCERS
+
+
+def new_db_handler(ttl_seconds=300):
+    return DatabaseHandler(db_host='localhost', db_user='user', db_password='password',
+                           db_name='name', machine_name='machine', ttl_seconds=ttl_seconds)
+
+
+def fake_connection(row):
+    """A pooled connection whose cursor returns row for any query."""
+    cursor = mock.MagicMock()
+    cursor.fetchone.return_value = row
+    connection = mock.MagicMock()
+    connection.cursor.return_value.__enter__.return_value = cursor
+    return connection
+
+
+@pytest.mark.parametrize('value, expected', [
+    (True, True),
+    (False, False),
+    (1, True),
+    (0, False),
+    (Decimal('1'), True),
+    (Decimal(0), False),
+    (' Yes ', True),
+    ('false', False),
+    (b'\x01', True),
+    (b'\x00', False),
+    (b'true', True),
+])
+def test_coercers(value, expected):
+    """
+    _COERCERS converts every supported column type, including BIT
+    columns returned as bytes.
+    """
+    assert _COERCERS[type(value)](value) is expected
+
+
+@pytest.mark.parametrize('row, expected', [
+    ((b'\x01',), True),
+    ((b'\x00',), False),
+    ((1,), True),
+    (('no',), False),
+    ((None,), None),
+    (None, None),
+])
+def test_should_use_paper_account_row(row, expected):
+    """
+    should_use_paper_account coerces the queried column, returning None
+    for NULL values and missing rows.
+    """
+    handler = new_db_handler()
+    connection = fake_connection(row)
+    with mock.patch.object(handler, '_connect', return_value=connection):
+        assert handler.should_use_paper_account() is expected
+    connection.close.assert_called_once()
+
+
+def test_should_use_paper_account_ttl_cache():
+    """
+    Results are served from the cache until ttl_seconds have passed.
+    """
+    handler = new_db_handler(ttl_seconds=60)
+    with mock.patch.object(DatabaseHandler, '_query_use_paper_account', side_effect=[True, False]) as query, \
+            mock.patch('ibeam.src.handlers.db_handler.time.monotonic', return_value=1000):
+        assert handler.should_use_paper_account() is True
+        assert handler.should_use_paper_account() is True
+        assert handler.is_cached()
+        assert query.call_count == 1
+
+    with mock.patch.object(DatabaseHandler, '_query_use_paper_account', return_value=False) as query, \
+            mock.patch('ibeam.src.handlers.db_handler.time.monotonic', return_value=1061):
+        assert not handler.is_cached()
+        assert handler.should_use_paper_account() is False
+        assert query.call_count == 1
+
+
+def test_should_use_paper_account_ttl_zero():
+    """
+    A TTL of 0 queries the database on every call.
+    """
+    handler = new_db_handler(ttl_seconds=0)
+    with mock.patch.object(DatabaseHandler, '_query_use_paper_account', side_effect=[True, False]) as query:
+        assert handler.should_use_paper_account() is True
+        assert handler.should_use_paper_account() is False
+        assert query.call_count == 2
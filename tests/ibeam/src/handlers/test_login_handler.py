@@ -0,0 +1,52 @@
+"""
+Tests for ibeam.src.handlers.login_handler
+"""
+from unittest import mock
+
+import pytest
+
+pytest.importorskip('selenium')
+
+from ibeam.src.handlers.login_handler import LoginHandler
+
+
+class StopAttempt(Exception):
+    pass
+
+
+def new_login_handler(secrets_handler):
+    return LoginHandler(
+        secrets_handler=secrets_handler,
+        two_fa_handler=None,
+        driver_factory=None,
+        targets=None,
+        base_url='https://localhost:5000',
+        route_auth='/sso/Login',
+        two_fa_select_target='IB Key',
+        strict_two_fa_code=True,
+        max_immediate_attempts=1,
+        oauth_timeout=15,
+        max_presubmit_buffer=30,
+        min_presubmit_buffer=5,
+        max_failed_auth=1,
+        outputs_dir='/tmp',
+    )
+
+
+@pytest.mark.parametrize('use_paper', [True, False])
+def test_attempt_decides_paper_once(use_paper):
+    """
+    attempt passes the paper decision that selected the credentials to
+    step_login, rather than checking the database again for the toggle.
+    """
+    secrets_handler = mock.Mock()
+    secrets_handler.credentials = (use_paper, 'account', 'password')
+    type(secrets_handler).use_paper_account = mock.PropertyMock(side_effect=AssertionError('checked twice'))
+    secrets_handler.key = None
+
+    handler = new_login_handler(secrets_handler)
+    with mock.patch.object(handler, 'step_login', side_effect=StopAttempt) as step_login:
+        with pytest.raises(StopAttempt):
+            handler.attempt(targets=None, wait_and_identify_trigger=None, driver=None)
+
+    step_login.assert_called_once_with(None, None, None, 'account', 'password', None, 5, use_paper)
@@ -0,0 +1,163 @@
+"""
+Tests for ibeam.src.handlers.secrets_handler
+"""
+import base64
+import os
+import threading
+from unittest import mock
+
+import pytest
+
+from ibeam.src.handlers.db_handler import DatabaseHandler
+from ibeam.src.handlers.secrets_handler import SecretsHandler
+from ibeam.src.handlers.secrets_handler import SECRETS_SOURCE_ENV
+from ibeam.src.handlers.secrets_handler import SECRETS_SOURCE_FS
+from ibeam.src.handlers.secrets_handler import SECRETS_SOURCE_GCP_SECRETS
+from ibeam.src.handlers.secrets_handler import _strip
+
+LIVE_ENV = {'IBEAM_ACCOUNT': 'live_account', 'IBEAM_PASSWORD': 'live_password'}
+
+
+def new_secrets_handler(secrets_source=SECRETS_SOURCE_ENV, **kwargs):
+    """A SecretsHandler with the database fully configured."""
+    return SecretsHandler(
+        secrets_source=secrets_source,
+        db_host='localhost',
+        db_user='user',
+        db_password='password',
+        db_name='name',
+        machine_name='machine',
+        paper_account='paper_account',
+        paper_password='paper_password',
+        **kwargs,
+    )
+
+
+def fake_response(json):
+    response = mock.Mock(status_code=200)
+    response.json.return_value = json
+    return response
+
+
+@pytest.mark.parametrize('lstrip, rstrip, expected', [
+    (None, None, ' \nsecret\n '),
+    (None, '\n ', ' \nsecret'),
+    (' \n', None, 'secret\n '),
+    (' \n', ' \n', 'secret'),
+    (' ', '\n', '\nsecret\n '),
+])
+def test_strip(lstrip, rstrip, expected):
+    """
+    _strip strips each side with its own characters, including when
+    both sides strip the same characters.
+    """
+    assert _strip(' \nsecret\n ', lstrip, rstrip) == expected
+
+
+@mock.patch.dict(os.environ, {'IBEAM_KEY': '--key--'})
+def test_secret_value_same_strip_both_sides():
+    """
+    secret_value strips both sides when lstrip == rstrip.
+    """
+    handler = SecretsHandler(secrets_source=SECRETS_SOURCE_ENV)
+    assert handler.secret_value(handler.encoding, 'IBEAM_KEY', lstrip='-', rstrip='-') == 'key'
+
+
+def test_fs_secret_rewritten_in_place(tmp_path):
+    """
+    A cached FS secret is read again once its file is modified.
+    """
+    secret_file = tmp_path / 'password'
+    secret_file.write_text('first\n')
+    os.utime(secret_file, ns=(1_000_000_000, 1_000_000_000))
+
+    with mock.patch.dict(os.environ, {'IBEAM_PASSWORD': str(secret_file)}):
+        handler = SecretsHandler(secrets_source=SECRETS_SOURCE_FS)
+        assert handler.password == 'first'
+
+        with mock.patch('pathlib.Path.read_text', side_effect=AssertionError('should be cached')):
+            assert handler.password == 'first'
+
+        secret_file.write_text('second\n')
+        os.utime(secret_file, ns=(2_000_000_000, 2_000_000_000))
+        assert handler.password == 'second'
+
+
+@mock.patch.dict(os.environ, LIVE_ENV)
+def test_db_check_timeout_then_late_completion():
+    """
+    When the startup database check times out, the default configuration
+    is used consistently until the check completes, without starting a
+    second query. Its result is used once it completes.
+    """
+    release = threading.Event()
+    started = []
+
+    def slow_query(self):
+        started.append(True)
+        release.wait(5)
+        return True
+
+    with mock.patch.object(DatabaseHandler, '_query_use_paper_account', slow_query):
+        handler = new_secrets_handler(db_check_timeout=0.1)
+
+        assert handler.credentials == (False, 'live_account', 'live_password')
+        assert handler.use_paper_account is False
+        assert handler.credentials == (False, 'live_account', 'live_password')
+
+        release.set()
+        handler._db_future.result(5)
+
+        assert handler.credentials == (True, 'paper_account', 'paper_password')
+        assert handler.use_paper_account is True
+        assert len(started) == 1
+
+
+@mock.patch.dict(os.environ, LIVE_ENV)
+def test_credentials_consistent_with_zero_ttl():
+    """
+    With a TTL of 0 each check queries the database again, but the paper
+    decision returned by credentials always matches the credentials.
+    """
+    answers = iter([True, False, True, False, True])
+
+    with mock.patch.object(DatabaseHandler, '_query_use_paper_account', lambda self: next(answers)):
+        handler = new_secrets_handler(db_check_ttl=0)
+        handler._db_future.result(5)
+
+        for _ in range(4):
+            use_paper, account, password = handler.credentials
+            if use_paper:
+                assert (account, password) == ('paper_account', 'paper_password')
+            else:
+                assert (account, password) == ('live_account', 'live_password')
+
+
+@mock.patch.dict(os.environ, {'IBEAM_ACCOUNT': 'account/versions/1', 'IBEAM_PASSWORD': 'password/versions/1'})
+def test_gcp_token_reused_until_expiry():
+    """
+    The GCP metadata token is reused for each secret until shortly
+    before it expires, and every request has a timeout.
+    """
+    def get(url, headers=None, timeout=None):
+        assert timeout is not None
+        if url.startswith('http://169.254.169.254'):
+            return fake_response({'access_token': 'token', 'expires_in': 3600})
+        return fake_response({'payload': {'data': base64.b64encode(url.encode()).decode()}})
+
+    handler = SecretsHandler(secrets_source=SECRETS_SOURCE_GCP_SECRETS, gcp_base_url='https://secrets')
+    handler._http = mock.Mock()
+    handler._http.get.side_effect = get
+
+    def metadata_calls():
+        return [c for c in handler._http.get.call_args_list if c.args[0].startswith('http://169.254.169.254')]
+
+    with mock.patch('ibeam.src.handlers.secrets_handler.time.monotonic', return_value=1000):
+        assert handler.account == 'https://secrets/account/versions/1:access'
+        assert handler.password == 'https://secrets/password/versions/1:access'
+        assert len(metadata_calls()) == 1
+
+    handler.refresh()
+    with mock.patch('ibeam.src.handlers.secrets_handler.time.monotonic', return_value=1000 + 3600 - 30):
+        assert handler.account == 'https://secrets/account/versions/1:access'
+        assert len(metadata_calls()) == 2